@@ -1,10 +1,20 @@
 import os
+import asyncio
+import functools
 import discord
 import aiohttp
+import orjson
+import yarl
 import logging
-import textwrap
+from collections import deque
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 load_dotenv()
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -12,41 +22,112 @@ GEMINI_MODEL = "gemini-1.5-pro-001"
 MAX_HISTORY_TURNS = 10
 MAX_RESPONSE_LENGTH = 1990
 SYSTEM_INSTRUCTION_MAX_LENGTH = 1000
+MAX_TRACKED_USERS = 10000
+USER_STATE_TTL_SECONDS = 86400
+THREADED_PARSE_THRESHOLD = 16384
+GEMINI_TIMEOUT_SECONDS = 300
+NOT_ADDED_NOTE = "Your message was not added to history."
+
+GEMINI_URL = yarl.URL(f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent").with_query(key=GEMINI_API_KEY or "")
+REQUEST_HEADERS = {"Content-Type": "application/json"}
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "topP": 1,
+    "topK": 1,
+}
+SAFETY_SETTINGS = (
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+)
+
+# The request body minus its opening brace; per-request fields are spliced in front of it.
+STATIC_PAYLOAD_TAIL = orjson.dumps({"generationConfig": GENERATION_CONFIG, "safetySettings": SAFETY_SETTINGS})[1:]
+
+NO_MENTIONS = discord.AllowedMentions.none()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(levelname)s:%(name)s: %(message)s')
 logger = logging.getLogger(__name__)
 
+def split_message(text: str, max_len: int = MAX_RESPONSE_LENGTH) -> list:
+    """Splits text into chunks of at most max_len, preferring newline then space boundaries."""
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = start + max_len
+        if end >= length:
+            cut = next_start = length
+        else:
+            cut = text.rfind("\n", start, end + 1)
+            if cut < start + max_len // 2:
+                cut = text.rfind(" ", start, end + 1)
+            if cut < start + max_len // 2:
+                cut = next_start = end
+            else:
+                next_start = cut + 1
+        chunk = text[start:cut]
+        # Discord rejects messages that are empty or whitespace-only.
+        if chunk.strip():
+            chunks.append(chunk)
+        start = next_start
+    return chunks
+
 async def send_long_message(interaction: discord.Interaction, text: str, followup: bool = True, ephemeral: bool = False):
     """Sends a potentially long message, splitting it if necessary."""
     max_len = MAX_RESPONSE_LENGTH
-    chunks = []
 
-    if len(text) <= max_len:
-        chunks.append(text)
+    if followup:
+        send_first = functools.partial(interaction.followup.send, ephemeral=ephemeral)
+    elif not interaction.response.is_done():
+        send_first = functools.partial(interaction.response.send_message, ephemeral=ephemeral)
     else:
-        logger.info(f"Splitting long message (length {len(text)}) for user {interaction.user.id}")
-        chunks = textwrap.wrap(
-            text,
-            max_len,
-            break_long_words=True,
-            replace_whitespace=False,
-            break_on_hyphens=False
-            )
+        send_first = interaction.channel.send
 
-    first_chunk = True
-    sent_initial_response = interaction.response.is_done()
+    if len(text) <= max_len:
+        await send_first(text, allowed_mentions=NO_MENTIONS)
+        return
 
-    for chunk in chunks:
-        if first_chunk:
-            if followup:
-                await interaction.followup.send(chunk, ephemeral=ephemeral)
-            elif not sent_initial_response:
-                await interaction.response.send_message(chunk, ephemeral=ephemeral)
-            else:
-                 await interaction.channel.send(chunk)
-            first_chunk = False
-        else:
-            await interaction.channel.send(chunk)
+    logger.info("Splitting long message (length %d) for user %s", len(text), interaction.user.id)
+    chunks = split_message(text, max_len)
+    if not chunks:
+        return
+
+    await send_first(chunks[0], allowed_mentions=NO_MENTIONS)
+    for chunk in chunks[1:]:
+        await interaction.channel.send(chunk, allowed_mentions=NO_MENTIONS)
+
+class HistoryStore:
+    """Per-user conversation histories, bounded in turns, number of users and idle time."""
+
+    def __init__(self, max_users: int = MAX_TRACKED_USERS, max_entries: int = MAX_HISTORY_TURNS * 2, ttl: float = USER_STATE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self._data = TTLCache(maxsize=max_users, ttl=ttl)
+
+    def get(self, user_id: int) -> deque:
+        """Returns the user's history, creating it if needed. Evicts the least recently used user when full."""
+        history = self._data.get(user_id)
+        if history is None:
+            history = deque(maxlen=self.max_entries)
+        self._data[user_id] = history
+        return history
+
+    def find(self, user_id: int):
+        """Returns the user's history if one exists, otherwise None."""
+        history = self._data.get(user_id)
+        if history is not None:
+            self._data[user_id] = history
+        return history
+
+    def __delitem__(self, user_id: int):
+        del self._data[user_id]
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -56,15 +137,48 @@ class GeminiBot(discord.Client):
         super().__init__(intents=intents)
         self.tree = discord.app_commands.CommandTree(self)
         self.session = None
-        self.histories = {}
-        self.system_instructions = {}
+        self.histories = HistoryStore()
+        self.system_instructions = TTLCache(maxsize=MAX_TRACKED_USERS, ttl=USER_STATE_TTL_SECONDS)
+        self._commands_meta = ()
+        self._help_embed = None
+        self._inflight = set()
 
     async def setup_hook(self):
         """Initialize resources and sync commands when the bot connects."""
-        self.session = aiohttp.ClientSession()
+        connector = aiohttp.TCPConnector(
+            limit=200,
+            limit_per_host=100,
+            ttl_dns_cache=300,
+            keepalive_timeout=75,
+            enable_cleanup_closed=True
+            )
+        timeout = aiohttp.ClientTimeout(total=GEMINI_TIMEOUT_SECONDS, connect=10, sock_read=GEMINI_TIMEOUT_SECONDS)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout, headers=REQUEST_HEADERS)
         logger.info("aiohttp ClientSession created.")
         await self.tree.sync()
         logger.info("Slash commands synced globally.")
+        self._commands_meta = tuple(
+            (cmd.name, cmd.description, tuple(p.name for p in cmd.parameters))
+            for cmd in self.tree.get_commands()
+        )
+        self._help_embed = self.build_help_embed()
+
+    def build_help_embed(self) -> discord.Embed:
+        """Builds the /help embed from the command snapshot taken after sync."""
+        embed = discord.Embed(
+            title=f"{self.user.name} Commands",
+            description="Here are the commands you can use with me:",
+            color=discord.Color.blue()
+        )
+
+        for name, description, param_names in self._commands_meta:
+            params_desc = ""
+            if param_names:
+                params_desc = " " + " ".join(f"`<{p}>`" for p in param_names)
+            embed.add_field(name=f"`/{name}{params_desc}`", value=description, inline=False)
+
+        embed.set_footer(text="Conversations have history unless reset with /reset_history.")
+        return embed
 
     async def close(self):
         """Clean up resources when the bot disconnects."""
@@ -75,14 +189,19 @@ class GeminiBot(discord.Client):
 
     async def on_ready(self):
         """Called when the bot is ready and connected to Discord."""
-        logger.info(f'Logged in as {self.user} (ID: {self.user.id})')
+        logger.info('Logged in as %s (ID: %s)', self.user, self.user.id)
         logger.info('Bot is ready and listening for commands.')
         activity = discord.Activity(type=discord.ActivityType.custom, name="Custom Status", state=" Made by notdoctored")
         await self.change_presence(activity=activity)
-        logger.info(f"Set presence: {activity.state}")
+        logger.info("Set presence: %s", activity.state)
+
 
+def rollback_last_user_message(history: deque):
+    """Drops the pending user message from history after a failed request."""
+    if history and history[-1].get("role") == "user":
+        history.pop()
 
-async def ask_gemini(user_id: int, question: str, session: aiohttp.ClientSession, histories: dict, system_instructions: dict):
+async def ask_gemini(user_id: int, question: str, session: aiohttp.ClientSession, histories: HistoryStore, system_instructions: TTLCache):
     """
     sends a question to the Gemini API, maintaining conversation history and using system instructions.
 
@@ -90,143 +209,121 @@ async def ask_gemini(user_id: int, question: str, session: aiohttp.ClientSession
         user_id: the Discord user ID to manage history and instructions for.
         question: the user's question.
         session: the aiohttp cclientSession for making requests.
-        histories: the dictionary storing conversation histories.
-        system_instructions: the dictionary storing user-specific system instructions.
+        histories: the store holding conversation histories.
+        system_instructions: the cache storing user-specific system instructions, already wrapped as Gemini content.
 
     Returns:
         The text response from Gemini or an error message string.
     """
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
-    headers = {"Content-Type": "application/json"}
-
-    user_history = histories.get(user_id, [])
+    user_history = histories.get(user_id)
     user_history.append({"role": "user", "parts": [{"text": question}]})
 
-    if len(user_history) > MAX_HISTORY_TURNS * 2:
-        user_history = user_history[-(MAX_HISTORY_TURNS * 2):]
-
-    payload = {
-        "contents": user_history,
-        "generationConfig": {
-            "temperature": 0.7,
-            "topP": 1,
-            "topK": 1,
-        },
-         "safetySettings": [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        ]
-    }
-
     user_system_instruction = system_instructions.get(user_id)
     if user_system_instruction:
-        payload["systemInstruction"] = {
-            "parts": [{"text": user_system_instruction}]
-        }
-        logger.debug(f"Using system instruction for user {user_id}")
+        system_instructions[user_id] = user_system_instruction
+        logger.debug("Using system instruction for user %s", user_id)
 
     try:
-        async with session.post(url, headers=headers, json=payload) as response:
-            response_data = await response.json()
-            logger.debug(f"Gemini API Response Status: {response.status}")
+        body_parts = [b'{"contents":', orjson.dumps(list(user_history)), b',']
+        if user_system_instruction:
+            body_parts += [b'"systemInstruction":', orjson.dumps(user_system_instruction), b',']
+        body_parts.append(STATIC_PAYLOAD_TAIL)
+
+        async with session.post(GEMINI_URL, data=b"".join(body_parts)) as response:
+            logger.debug("Gemini API Response Status: %s", response.status)
 
             if response.status == 200:
+                raw_body = await response.read()
+                if len(raw_body) > THREADED_PARSE_THRESHOLD:
+                    response_data = await asyncio.to_thread(orjson.loads, raw_body)
+                else:
+                    response_data = orjson.loads(raw_body)
                 if 'candidates' in response_data and response_data['candidates']:
                     candidate = response_data['candidates'][0]
                     if 'content' in candidate and 'parts' in candidate['content'] and candidate['content']['parts']:
                         response_text = candidate['content']['parts'][0]['text']
                         user_history.append({"role": "model", "parts": [{"text": response_text}]})
-                        histories[user_id] = user_history
                         return response_text
                     elif 'finishReason' in candidate and candidate['finishReason'] != 'STOP':
                          reason = candidate.get('finishReason', 'UNKNOWN')
                          safety_ratings = candidate.get('safetyRatings', [])
-                         logger.warning(f"Gemini response generation stopped for user {user_id}. Reason: {reason}, Safety: {safety_ratings}")
-                         histories[user_id] = user_history
+                         logger.warning("Gemini response generation stopped for user %s. Reason: %s, Safety: %s", user_id, reason, safety_ratings)
                          return f"this response generation was stopped. Reason: `{reason}`. Please modify your prompt or check safety settings. Your message was added to the history for context."
                     else:
-                        logger.error(f"Gemini API response missing expected content structure in candidate for user {user_id}: {candidate}")
-                        histories[user_id] = user_history
+                        logger.error("Gemini API response missing expected content structure in candidate for user %s: %s", user_id, candidate)
                         return "Sorry, I received an unexpected response structure from the AI after generation. Your message was added to the history."
                 elif 'promptFeedback' in response_data:
                      feedback = response_data['promptFeedback']
                      block_reason = feedback.get('blockReason', 'UNKNOWN')
                      safety_ratings = feedback.get('safetyRatings', [])
-                     logger.warning(f"Gemini prompt blocked for user {user_id}. Reason: {block_reason}, Safety: {safety_ratings}")
-                     if user_history and user_history[-1]["role"] == "user":
-                         user_history.pop()
-                         histories[user_id] = user_history
+                     logger.warning("Gemini prompt blocked for user %s. Reason: %s, Safety: %s", user_id, block_reason, safety_ratings)
+                     rollback_last_user_message(user_history)
                      return f"Your prompt was blocked before generation. Reason: `{block_reason}`. Please rephrase your message. It was not added to the history."
                 else:
-                    logger.error(f"Gemini API response missing 'candidates' or 'promptFeedback' for user {user_id}: {response_data}")
-                    if user_history and user_history[-1]["role"] == "user":
-                         user_history.pop()
-                         histories[user_id] = user_history
-                    return "Sorry, I received an incomplete or unexpected response format from the AI. Your message was not added to the history."
+                    logger.error("Gemini API response missing 'candidates' or 'promptFeedback' for user %s: %s", user_id, response_data)
+                    rollback_last_user_message(user_history)
+                    return f"Sorry, I received an incomplete or unexpected response format from the AI. {NOT_ADDED_NOTE}"
             else:
+                try:
+                    response_data = orjson.loads(await response.read())
+                except orjson.JSONDecodeError:
+                    response_data = {}
                 error_details = response_data.get('error', {}).get('message', 'No specific error message.')
-                logger.error(f"Gemini API error {response.status} for user {user_id}: {error_details} - Response: {response_data}")
-                if user_history and user_history[-1]["role"] == "user":
-                    user_history.pop()
-                    histories[user_id] = user_history
-                return f"Sorry, there was an error communicating with the AI (Status {response.status}). Details: {error_details[:300]}. Your message was not added to history."
+                logger.error("Gemini API error %s for user %s: %s - Response: %.500s", response.status, user_id, error_details, response_data)
+                logger.debug("Gemini API error response for user %s: %s", user_id, response_data)
+                rollback_last_user_message(user_history)
+                return f"Sorry, there was an error communicating with the AI (Status {response.status}). Details: {error_details[:300]}. {NOT_ADDED_NOTE}"
 
     except aiohttp.ClientConnectorError as e:
-        logger.exception(f"Network error connecting to Gemini API for user {user_id}.")
-        if user_history and user_history[-1]["role"] == "user":
-            user_history.pop()
-            histories[user_id] = user_history
-        return f"Sorry, I couldn't connect to the AI service. Please check the bot's network connection. Error: {e}. Your message was not added to history."
+        logger.exception("Network error connecting to Gemini API for user %s.", user_id)
+        rollback_last_user_message(user_history)
+        return f"Sorry, I couldn't connect to the AI service. Please check the bot's network connection. Error: {e}. {NOT_ADDED_NOTE}"
+    except asyncio.TimeoutError:
+        logger.warning("Gemini API request timed out for user %s after %s seconds.", user_id, GEMINI_TIMEOUT_SECONDS)
+        rollback_last_user_message(user_history)
+        return f"Sorry, the AI took too long to respond. Please try again or ask for a shorter answer. {NOT_ADDED_NOTE}"
     except Exception as e:
-        logger.exception(f"An unexpected error occurred during the Gemini API call for user {user_id}.")
-        if user_history and user_history[-1]["role"] == "user":
-            user_history.pop()
-            histories[user_id] = user_history
-        return f"An unexpected error occurred while talking to the AI: {e}. Your message was not added to history."
+        logger.exception("An unexpected error occurred during the Gemini API call for user %s.", user_id)
+        rollback_last_user_message(user_history)
+        return f"An unexpected error occurred while talking to the AI: {e}. {NOT_ADDED_NOTE}"
 
 bot = GeminiBot()
 
 @bot.tree.command(name="help", description="Shows a list of available commands.")
 async def help_command(interaction: discord.Interaction):
     """Provides a list of all available slash commands."""
-    embed = discord.Embed(
-        title=f"{bot.user.name} Commands",
-        description="Here are the commands you can use with me:",
-        color=discord.Color.blue()
-    )
-
-    for cmd in bot.tree.get_commands():
-        params_desc = ""
-        if cmd.parameters:
-            params_desc = " " + " ".join(f"`<{p.name}>`" for p in cmd.parameters)
-        embed.add_field(name=f"`/{cmd.name}{params_desc}`", value=cmd.description, inline=False)
-
-    embed.set_footer(text="Conversations have history unless reset with /reset_history.")
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    await interaction.response.send_message(embed=bot._help_embed, ephemeral=True)
 
 
 @bot.tree.command(name="ask", description="ask the AI a question (maintains conversation history).")
 @discord.app_commands.describe(question="Your question for the AI")
 async def ask(interaction: discord.Interaction, question: str):
     """Handles the /ask slash command."""
-    await interaction.response.defer(thinking=True, ephemeral=False)
     user_id = interaction.user.id
-    context = "Unknown Context"
-    if interaction.guild:
-        context = f"Server: {interaction.guild.name} ({interaction.guild_id}), Channel: #{interaction.channel.name}"
-    elif interaction.channel.type == discord.ChannelType.private:
-        context = "Direct Message"
-    elif interaction.channel.type == discord.ChannelType.group:
-        context = f"Group DM ({interaction.channel.id})"
+    if user_id in bot._inflight:
+        logger.info("User %s (%s) sent /ask while a previous question was still in flight.", interaction.user, user_id)
+        await interaction.response.send_message("I'm still working on your previous question. Please wait for my answer before asking again.", ephemeral=True)
+        return
+
+    bot._inflight.add(user_id)
+    try:
+        await interaction.response.defer(thinking=True, ephemeral=False)
+        context = "Unknown Context"
+        if interaction.guild:
+            context = f"Server: {interaction.guild.name} ({interaction.guild_id}), Channel: #{interaction.channel.name}"
+        elif interaction.channel.type == discord.ChannelType.private:
+            context = "Direct Message"
+        elif interaction.channel.type == discord.ChannelType.group:
+            context = f"Group DM ({interaction.channel.id})"
 
-    logger.info(f"User {interaction.user} ({user_id}) in {context} asked: '{question[:100]}...'")
+        logger.info("User %s (%s) in %s asked: '%.100s...'", interaction.user, user_id, context, question)
 
-    answer = await ask_gemini(user_id, question, bot.session, bot.histories, bot.system_instructions)
+        answer = await ask_gemini(user_id, question, bot.session, bot.histories, bot.system_instructions)
 
-    await send_long_message(interaction, answer, followup=True, ephemeral=False)
-    logger.info(f"Sent response (length {len(answer)}) to {interaction.user} ({user_id}) in {context}")
+        await send_long_message(interaction, answer, followup=True, ephemeral=False)
+        logger.info("Sent response (length %d) to %s (%s) in %s", len(answer), interaction.user, user_id, context)
+    finally:
+        bot._inflight.discard(user_id)
 
 
 @bot.tree.command(name="reset_history", description="Reset your conversation history with the AI.")
@@ -235,10 +332,10 @@ async def reset_history(interaction: discord.Interaction):
     user_id = interaction.user.id
     if user_id in bot.histories:
         del bot.histories[user_id]
-        logger.info(f"Reset history for user {interaction.user} (ID: {user_id})")
+        logger.info("Reset history for user %s (ID: %s)", interaction.user, user_id)
         await interaction.response.send_message("🧹 Your chat history with me has been cleared.", ephemeral=True)
     else:
-        logger.info(f"User {interaction.user} (ID: {user_id}) attempted to reset non-existent history.")
+        logger.info("User %s (ID: %s) attempted to reset non-existent history.", interaction.user, user_id)
         await interaction.response.send_message("You don't have any chat history with me yet.", ephemeral=True)
 
 
@@ -251,8 +348,8 @@ async def set_prompt(interaction: discord.Interaction, instruction: str):
         await interaction.response.send_message(f"Error: System instruction is too long (max {SYSTEM_INSTRUCTION_MAX_LENGTH} characters). Please shorten it.", ephemeral=True)
         return
 
-    bot.system_instructions[user_id] = instruction
-    logger.info(f"Set system instruction for user {interaction.user} (ID: {user_id})")
+    bot.system_instructions[user_id] = {"parts": [{"text": instruction}]}
+    logger.info("Set system instruction for user %s (ID: %s)", interaction.user, user_id)
     await interaction.response.send_message(f"✅ Understood! I will now try to follow these instructions for our conversation:\n```\n{instruction}\n```\nUse `/reset_prompt` to clear this.", ephemeral=True)
 
 
@@ -262,10 +359,10 @@ async def reset_prompt(interaction: discord.Interaction):
     user_id = interaction.user.id
     if user_id in bot.system_instructions:
         del bot.system_instructions[user_id]
-        logger.info(f"Reset system instruction for user {interaction.user} (ID: {user_id})")
+        logger.info("Reset system instruction for user %s (ID: %s)", interaction.user, user_id)
         await interaction.response.send_message(" My custom system instruction for our chat has been reset to default.", ephemeral=True)
     else:
-        logger.info(f"User {interaction.user} (ID: {user_id}) attempted to reset non-existent system instruction.")
+        logger.info("User %s (ID: %s) attempted to reset non-existent system instruction.", interaction.user, user_id)
         await interaction.response.send_message("You haven't set a custom system instruction with me yet.", ephemeral=True)
 
 
@@ -273,27 +370,28 @@ async def reset_prompt(interaction: discord.Interaction):
 async def forget_last(interaction: discord.Interaction):
     """Removes the last user message and model response from the history."""
     user_id = interaction.user.id
-    if user_id in bot.histories and len(bot.histories[user_id]) >= 2:
-        last_entry = bot.histories[user_id][-1]
-        second_last_entry = bot.histories[user_id][-2]
+    history = bot.histories.find(user_id)
+    if history and len(history) >= 2:
+        last_entry = history[-1]
+        second_last_entry = history[-2]
 
         if second_last_entry.get("role") == "user" and last_entry.get("role") == "model":
-            last_model = bot.histories[user_id].pop()
-            last_user = bot.histories[user_id].pop()
-            logger.info(f"User {interaction.user} ({user_id}) used /forget. Removed last user msg and model response.")
+            last_model = history.pop()
+            last_user = history.pop()
+            logger.info("User %s (%s) used /forget. Removed last user msg and model response.", interaction.user, user_id)
             await interaction.response.send_message(f" Okay, I've forgotten our last exchange (your question starting with \"{last_user['parts'][0]['text'][:50]}...\" and my response).", ephemeral=True)
         else:
-            bot.histories[user_id].pop()
-            bot.histories[user_id].pop()
-            logger.warning(f"User {interaction.user} ({user_id}) used /forget. Popped last two entries, roles might have been unusual: {second_last_entry.get('role')}, {last_entry.get('role')}")
+            history.pop()
+            history.pop()
+            logger.warning("User %s (%s) used /forget. Popped last two entries, roles might have been unusual: %s, %s", interaction.user, user_id, second_last_entry.get('role'), last_entry.get('role'))
             await interaction.response.send_message(f" Okay, I've forgotten the last two messages in our history.", ephemeral=True)
 
-    elif user_id in bot.histories and len(bot.histories[user_id]) == 1:
-         last_user = bot.histories[user_id].pop()
-         logger.info(f"User {interaction.user} ({user_id}) used /forget. Removed the only message in history (user: '{last_user['parts'][0]['text'][:50]}...')")
+    elif history:
+         last_user = history.pop()
+         logger.info("User %s (%s) used /forget. Removed the only message in history (user: '%.50s...')", interaction.user, user_id, last_user['parts'][0]['text'])
          await interaction.response.send_message(" Okay, I've forgotten your last message (there was no response from me yet).", ephemeral=True)
     else:
-        logger.info(f"User {interaction.user} ({user_id}) attempted /forget on empty history.")
+        logger.info("User %s (%s) attempted /forget on empty history.", interaction.user, user_id)
         await interaction.response.send_message("There's nothing in our recent history for me to forget!", ephemeral=True)
 
 
@@ -301,45 +399,50 @@ async def forget_last(interaction: discord.Interaction):
 async def show_history(interaction: discord.Interaction):
     """Displays the user's current conversation history ephemerally."""
     user_id = interaction.user.id
-    if user_id not in bot.histories or not bot.histories[user_id]:
+    history = bot.histories.find(user_id)
+    if not history:
         await interaction.response.send_message("You don't have any chat history with me yet.", ephemeral=True)
         return
 
     await interaction.response.defer(ephemeral=True, thinking=True)
 
-    history = bot.histories[user_id]
     num_turns = (len(history) + 1) // 2
-    formatted_history = f" **Conversation History (Approx. last {num_turns}/{MAX_HISTORY_TURNS} turns):**\n\n"
+    parts = [f" **Conversation History (Approx. last {num_turns}/{MAX_HISTORY_TURNS} turns):**\n\n"]
+    model_label = f"**Me ({GEMINI_MODEL}):**\n"
     turn_counter = 1
     current_role = None
-    for i, entry in enumerate(history):
+    for entry in history:
         role = entry.get("role", "unknown").capitalize()
-        text = entry.get("parts", [{}])[0].get("text", "*empty message*")
+        try:
+            text = entry["parts"][0]["text"]
+        except (KeyError, IndexError):
+            text = "*empty message*"
 
         if role == "User":
              if current_role != "User":
-                 formatted_history += f"**{turn_counter}. You:**\n"
+                 parts.append(f"**{turn_counter}. You:**\n")
                  turn_counter += 1
              else:
-                 formatted_history += f"**(... You continued):**\n"
+                 parts.append("**(... You continued):**\n")
              current_role = "User"
         elif role == "Model":
-             formatted_history += f"**Me ({GEMINI_MODEL}):**\n"
+             parts.append(model_label)
              current_role = "Model"
         else:
-            formatted_history += f"**{role}:**\n"
+            parts.append(f"**{role}:**\n")
             current_role = role
 
         display_text = text[:500] + '...' if len(text) > 500 else text
-        formatted_history += f"```\n{display_text}\n```\n"
+        parts.append(f"```\n{display_text}\n```\n")
 
+    formatted_history = "".join(parts)
     await send_long_message(interaction, formatted_history, followup=True, ephemeral=True)
 
 @bot.tree.command(name="ping", description="Check the bot's responsiveness.")
 async def ping(interaction: discord.Interaction):
     """Checks the bot's latency to Discord."""
     latency_ms = bot.latency * 1000
-    logger.info(f"Ping command used by {interaction.user}. Latency: {latency_ms:.2f} ms")
+    logger.info("Ping command used by %s. Latency: %.2f ms", interaction.user, latency_ms)
     await interaction.response.send_message(f"Pong! My latency to Discord is {latency_ms:.2f} ms.", ephemeral=True)
 
 
@@ -350,6 +453,9 @@ if __name__ == "__main__":
         logger.critical("FATAL ERROR: GEMINI_API_KEY not found in environment variables or .env file.")
     else:
         try:
+            if uvloop is not None:
+                asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+                logger.info("Using uvloop event loop.")
             logger.info("Starting bot...")
             bot.run(DISCORD_TOKEN, log_handler=None)
         except discord.LoginFailure:
@@ -357,4 +463,4 @@ if __name__ == "__main__":
         except discord.errors.PrivilegedIntentsRequired:
              logger.critical("FATAL ERROR: The 'Message Content' Intent is not enabled for this bot in the Discord Developer Portal (Application -> Bot -> Privileged Gateway Intents). It might be needed for future features or certain command argument types.")
         except Exception as e:
-            logger.critical(f"FATAL ERROR: Failed to start the bot - {e}", exc_info=True)
+            logger.critical("FATAL ERROR: Failed to start the bot - %s", e, exc_info=True)